@@ -0,0 +1,464 @@
+from __future__ import division
+from __future__ import print_function
+import numpy as np
+import pickle
+import struct
+import zlib
+import os
+import glob
+
+try:
+    import lzma
+except ImportError:  # Python 2.7 has no lzma in the standard library
+    lzma = None
+
+# Archival format for the dictionaries generated by generate_python_dict_data.py.
+#
+# The rows of a logging run are cut in blocks of block_size rows. In each block:
+# - measurement numbers and the timestamps of each signal are delta encoded
+#   (first value as uint32, then the uint32 wrap-around differences), so that the
+#   wrap-around of the Arduino micros() counter is handled exactly.
+# - the 10 bits ADC values of each signal are packed 4 samples in 5 bytes.
+# The payload of each block is then compressed with zlib or lzma.
+#
+# File layout:
+#   header | block 0 | block 1 | ... | block index | footer
+#
+# The block index gives, for each block, its position in the file and the range
+# of time it covers, so that a time window can be read by decompressing only the
+# blocks that overlap it. Time is the unwrapped Arduino timestamp of signal 0, in
+# uS: the first timestamp of the run, plus the cumulated uint32 wrap-around
+# differences between consecutive timestamps. It is equal to the Arduino timestamp
+# until the first wrap-around of micros() (about 71.6 minutes), and keeps growing
+# after it instead of starting again from 0.
+
+ARCHIVE_MAGIC = b'LGAR'
+ARCHIVE_INDEX_MAGIC = b'LGAI'
+ARCHIVE_VERSION = 2
+
+ARCHIVE_EXTENSION = ".lgar"
+
+# magic, version, codec, number of signals, block size, logger ID, number of rows,
+# length of UTC start string, length of UTC end string
+HEADER_FORMAT = '<4sBBBIIQHH'
+# offset in file, compressed size, number of rows, first row, time of first row, time of last row
+INDEX_ENTRY_FORMAT = '<QIIQQQ'
+# offset of the index in file, number of blocks, magic
+FOOTER_FORMAT = '<QI4s'
+
+dict_codecs = {'zlib': 0, 'lzma': 1}
+
+
+def load_pickle(handle):
+    """Load a pickle generated by LoggedDataConverter. These are written by
+    Python 2, and the numpy arrays they contain can only be read by Python 3 with
+    the latin1 encoding."""
+    try:
+        return(pickle.load(handle, encoding='latin1'))
+    except TypeError:  # Python 2 pickle.load has no encoding argument
+        handle.seek(0)
+        return(pickle.load(handle))
+
+
+def string_to_bytes(string_in):
+    if isinstance(string_in, bytes):  # str under Python 2, kept as is
+        return(string_in)
+
+    return(string_in.encode('utf-8'))
+
+
+def bytes_to_string(bytes_in):
+    """Give back the same type as the strings in the pickles: str under both
+    Python 2 (raw bytes) and Python 3 (decoded)."""
+    if isinstance(bytes_in, str):
+        return(bytes_in)
+
+    return(bytes_in.decode('utf-8'))
+
+
+def compress_payload(payload, codec):
+    if codec == dict_codecs['zlib']:
+        return(zlib.compress(payload, 9))
+    elif codec == dict_codecs['lzma']:
+        return(lzma.compress(payload))
+
+    raise ValueError("unknown codec: " + str(codec))
+
+
+def decompress_payload(payload, codec):
+    if codec == dict_codecs['zlib']:
+        return(zlib.decompress(payload))
+    elif codec == dict_codecs['lzma']:
+        if lzma is None:
+            raise ValueError("archive uses lzma, which is not available in this Python")
+        return(lzma.decompress(payload))
+
+    raise ValueError("unknown codec: " + str(codec))
+
+
+def as_uint32(array_in, name):
+    """Convert an array of values logged as integers by the Arduino (but possibly
+    stored as floats by numpy.genfromtxt) into uint32, checking nothing is lost."""
+    array_in = np.asarray(array_in)
+
+    if not np.all(np.isfinite(array_in)):
+        raise ValueError(name + " contains non finite values")
+
+    array_as_int = array_in.astype(np.int64)
+
+    if np.any(array_as_int != array_in) or np.any(array_as_int < 0) or np.any(array_as_int > 0xFFFFFFFF):
+        raise ValueError(name + " does not contain only uint32 values")
+
+    return(array_as_int.astype(np.uint32))
+
+
+def delta_encode(array_uint32):
+    """First value, then the differences between consecutive values, wrapping
+    around modulo 2**32."""
+    return(np.concatenate((array_uint32[0:1], np.diff(array_uint32))).astype('<u4').tobytes())
+
+
+def delta_decode(data, nbr_values):
+    deltas = np.frombuffer(data, dtype='<u4', count=nbr_values)
+    return(np.cumsum(deltas, dtype=np.uint32))
+
+
+def unwrap_timestamps(timestamps_uint32, first_time_uS):
+    """Time as uint64 starting at first_time_uS, following the uint32 wrap-around
+    differences between consecutive timestamps."""
+    unwrapped_timestamps = np.empty(timestamps_uint32.shape, dtype=np.uint64)
+    unwrapped_timestamps[0] = first_time_uS
+    unwrapped_timestamps[1:] = np.uint64(first_time_uS) + np.cumsum(np.diff(timestamps_uint32).astype(np.uint64), dtype=np.uint64)
+    return(unwrapped_timestamps)
+
+
+def pack_10_bits(values):
+    """Pack 10 bits values 4 by 4 into 5 bytes."""
+    nbr_values = values.shape[0]
+    padded = np.zeros(4 * ((nbr_values + 3) // 4), dtype=np.uint16)
+    padded[:nbr_values] = values
+    padded = padded.reshape(-1, 4)
+
+    packed = np.empty((padded.shape[0], 5), dtype=np.uint8)
+    packed[:, 0] = padded[:, 0] & 0xFF
+    packed[:, 1] = ((padded[:, 0] >> 8) | (padded[:, 1] << 2)) & 0xFF
+    packed[:, 2] = ((padded[:, 1] >> 6) | (padded[:, 2] << 4)) & 0xFF
+    packed[:, 3] = ((padded[:, 2] >> 4) | (padded[:, 3] << 6)) & 0xFF
+    packed[:, 4] = (padded[:, 3] >> 2) & 0xFF
+
+    return(packed.tobytes())
+
+
+def unpack_10_bits(data, nbr_values):
+    nbr_groups = (nbr_values + 3) // 4
+    packed = np.frombuffer(data, dtype=np.uint8, count=5 * nbr_groups).reshape(-1, 5).astype(np.uint16)
+
+    values = np.empty((nbr_groups, 4), dtype=np.uint16)
+    values[:, 0] = packed[:, 0] | ((packed[:, 1] & 0x03) << 8)
+    values[:, 1] = (packed[:, 1] >> 2) | ((packed[:, 2] & 0x0F) << 6)
+    values[:, 2] = (packed[:, 2] >> 4) | ((packed[:, 3] & 0x3F) << 4)
+    values[:, 3] = (packed[:, 3] >> 6) | (packed[:, 4] << 2)
+
+    return(values.reshape(-1)[:nbr_values])
+
+
+def size_packed_10_bits(nbr_values):
+    return(5 * ((nbr_values + 3) // 4))
+
+
+class LoggedDataArchiver(object):
+    """Write the dictionaries generated by LoggedDataConverter (or the
+    corresponding pickles) in the block compressed archival format."""
+
+    def __init__(self, verbose=0, path_in=None, path_out=None, block_size=4096, codec='zlib'):
+        self.verbose = verbose
+        self.list_generated_archives = []
+
+        if not 1 <= block_size <= 0xFFFFFFFF:
+            raise ValueError("block_size should be between 1 and 2**32 - 1")
+
+        self.block_size = block_size
+
+        if codec not in dict_codecs:
+            raise ValueError("codec should be one of " + str(sorted(dict_codecs.keys())))
+
+        if codec == 'lzma' and lzma is None:
+            raise ValueError("lzma is not available in this Python, use zlib")
+
+        self.codec = dict_codecs[codec]
+
+        self.path_in = path_in
+        if path_in is None:
+            self.path_in = os.getcwd()
+        self.path_in += "/"
+
+        if self.verbose > 0:
+            print("- using path_in: " + self.path_in)
+
+        self.path_out = path_out
+        if path_out is None:
+            self.path_out = os.getcwd()
+        self.path_out += "/"
+
+        if self.verbose > 0:
+            print("- using path_out: " + self.path_out)
+
+    def find_pickle_files(self):
+        regexp_string_pickles = self.path_in + '*.pkl'
+
+        if self.verbose > 4:
+            print("using regexp_string_pickles: " + regexp_string_pickles)
+
+        self.available_pickle_files = glob.glob(regexp_string_pickles)
+
+        if self.verbose > 0:
+            print("- found pickle files:")
+            for crrt_pickle in self.available_pickle_files:
+                print(crrt_pickle)
+
+    def write_archive(self, dict_datafile_data, archive_path):
+        """Write one dictionary with the layout generated by LoggedDataConverter
+        into an archive file."""
+
+        number_of_logged_signals = int(dict_datafile_data["number_of_logged_signals"])
+        measurement_numbers = as_uint32(dict_datafile_data["measurement_numbers"], "measurement_numbers")
+        nbr_rows = measurement_numbers.shape[0]
+
+        if nbr_rows == 0:
+            raise ValueError("no data to archive")
+
+        list_timestamps = []
+        list_data = []
+        for ind_signal in range(number_of_logged_signals):
+            crrt_timestamps = as_uint32(dict_datafile_data["timestamps_signal_" + str(ind_signal)], "timestamps_signal_" + str(ind_signal))
+            crrt_data = as_uint32(dict_datafile_data["data_signal_" + str(ind_signal)], "data_signal_" + str(ind_signal))
+
+            if crrt_timestamps.shape[0] != nbr_rows or crrt_data.shape[0] != nbr_rows:
+                raise ValueError("signal " + str(ind_signal) + " does not have the same length as measurement_numbers")
+
+            if np.any(crrt_data > 1023):
+                raise ValueError("data_signal_" + str(ind_signal) + " is not 10 bits ADC data")
+
+            list_timestamps.append(crrt_timestamps)
+            list_data.append(crrt_data.astype(np.uint16))
+
+        utc_start = string_to_bytes(dict_datafile_data["UTC_start"])
+        utc_end = string_to_bytes(dict_datafile_data["UTC_end"])
+        logger_ID = int(dict_datafile_data["logger_ID"])
+
+        if number_of_logged_signals > 0:
+            unwrapped_timestamps_signal_0 = unwrap_timestamps(list_timestamps[0], int(list_timestamps[0][0]))
+        else:
+            unwrapped_timestamps_signal_0 = np.zeros((nbr_rows,), dtype=np.uint64)
+
+        list_index_entries = []
+
+        # do not leave a truncated archive without block index if anything goes wrong
+        try:
+            with open(archive_path, 'wb') as handle:
+                handle.write(struct.pack(HEADER_FORMAT, ARCHIVE_MAGIC, ARCHIVE_VERSION, self.codec, number_of_logged_signals,
+                                         self.block_size, logger_ID, nbr_rows, len(utc_start), len(utc_end)))
+                handle.write(utc_start)
+                handle.write(utc_end)
+
+                for first_row in range(0, nbr_rows, self.block_size):
+                    last_row = min(first_row + self.block_size, nbr_rows)
+
+                    list_payload = [delta_encode(measurement_numbers[first_row: last_row])]
+                    for crrt_timestamps in list_timestamps:
+                        list_payload.append(delta_encode(crrt_timestamps[first_row: last_row]))
+                    for crrt_data in list_data:
+                        list_payload.append(pack_10_bits(crrt_data[first_row: last_row]))
+
+                    compressed_payload = compress_payload(b''.join(list_payload), self.codec)
+
+                    list_index_entries.append(struct.pack(INDEX_ENTRY_FORMAT, handle.tell(), len(compressed_payload), last_row - first_row, first_row,
+                                                          int(unwrapped_timestamps_signal_0[first_row]), int(unwrapped_timestamps_signal_0[last_row - 1])))
+                    handle.write(compressed_payload)
+
+                index_offset = handle.tell()
+                handle.write(b''.join(list_index_entries))
+                handle.write(struct.pack(FOOTER_FORMAT, index_offset, len(list_index_entries), ARCHIVE_INDEX_MAGIC))
+        except BaseException:
+            if os.path.exists(archive_path):
+                os.remove(archive_path)
+            raise
+
+        self.list_generated_archives.append(archive_path)
+
+        if self.verbose > 0:
+            print("- saved archive: " + archive_path + " (" + str(len(list_index_entries)) + " blocks)")
+
+    def archive_one_pickle(self, pickle_path):
+        if self.verbose > 0:
+            print("- processing pickle: " + pickle_path)
+
+        with open(pickle_path, 'rb') as handle:
+            dict_datafile_data = load_pickle(handle)
+
+        crrt_basename = os.path.basename(pickle_path)[: -4]
+        self.write_archive(dict_datafile_data, self.path_out + crrt_basename + ARCHIVE_EXTENSION)
+
+    def archive_one_folder(self):
+        for crrt_pickle in self.available_pickle_files:
+            self.archive_one_pickle(crrt_pickle)
+
+
+class LoggedDataArchiveReader(object):
+    """Read an archive written by LoggedDataArchiver. The header and block index
+    are read when the instance is created; data blocks are only decompressed when
+    needed."""
+
+    def __init__(self, archive_path, verbose=0):
+        self.archive_path = archive_path
+        self.verbose = verbose
+
+        message_truncated = self.archive_path + " has no valid block index, the file may be truncated"
+
+        file_size = os.path.getsize(self.archive_path)
+        header_size = struct.calcsize(HEADER_FORMAT)
+        footer_size = struct.calcsize(FOOTER_FORMAT)
+        index_entry_size = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+        if file_size < header_size + footer_size:
+            raise ValueError(message_truncated)
+
+        with open(self.archive_path, 'rb') as handle:
+            (magic, version, self.codec, self.number_of_logged_signals, self.block_size,
+             self.logger_ID, self.nbr_rows, len_utc_start, len_utc_end) = struct.unpack(HEADER_FORMAT, handle.read(header_size))
+
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError(self.archive_path + " is not a logged data archive")
+
+            if version != ARCHIVE_VERSION:
+                raise ValueError("unsupported archive version: " + str(version))
+
+            end_of_header = header_size + len_utc_start + len_utc_end
+
+            if end_of_header + footer_size > file_size:
+                raise ValueError(message_truncated)
+
+            self.UTC_start = bytes_to_string(handle.read(len_utc_start))
+            self.UTC_end = bytes_to_string(handle.read(len_utc_end))
+
+            handle.seek(-footer_size, os.SEEK_END)
+            (index_offset, nbr_blocks, index_magic) = struct.unpack(FOOTER_FORMAT, handle.read(footer_size))
+
+            # the index should sit between the header and the footer
+            if index_magic != ARCHIVE_INDEX_MAGIC or index_offset < end_of_header or \
+                    index_offset + nbr_blocks * index_entry_size != file_size - footer_size:
+                raise ValueError(message_truncated)
+
+            handle.seek(index_offset)
+            index_data = handle.read(nbr_blocks * index_entry_size)
+
+        self.list_index_entries = [struct.unpack_from(INDEX_ENTRY_FORMAT, index_data, ind_block * index_entry_size)
+                                   for ind_block in range(nbr_blocks)]
+
+        # and the blocks between the header and the index, covering all the rows
+        for (offset, compressed_size, nbr_rows_block, first_row, first_time_uS, last_time_uS) in self.list_index_entries:
+            if offset < end_of_header or offset + compressed_size > index_offset:
+                raise ValueError(message_truncated)
+
+        if sum(crrt_entry[2] for crrt_entry in self.list_index_entries) != self.nbr_rows:
+            raise ValueError(message_truncated)
+
+        if self.verbose > 0:
+            print("- opened archive: " + self.archive_path + " with " + str(nbr_blocks) + " blocks")
+
+    def decode_block(self, handle, ind_block):
+        """Return (measurement_numbers, list_timestamps, list_data) for one block."""
+        (offset, compressed_size, nbr_rows_block, first_row, first_time_uS, last_time_uS) = self.list_index_entries[ind_block]
+
+        handle.seek(offset)
+        payload = decompress_payload(handle.read(compressed_size), self.codec)
+
+        position = 0
+        size_deltas = 4 * nbr_rows_block
+        measurement_numbers = delta_decode(payload[position: position + size_deltas], nbr_rows_block)
+        position += size_deltas
+
+        list_timestamps = []
+        for ind_signal in range(self.number_of_logged_signals):
+            list_timestamps.append(delta_decode(payload[position: position + size_deltas], nbr_rows_block))
+            position += size_deltas
+
+        size_data = size_packed_10_bits(nbr_rows_block)
+        list_data = []
+        for ind_signal in range(self.number_of_logged_signals):
+            list_data.append(unpack_10_bits(payload[position: position + size_data], nbr_rows_block))
+            position += size_data
+
+        return(measurement_numbers, list_timestamps, list_data)
+
+    def assemble_dict(self, list_decoded_blocks, row_mask=None):
+        """Build a dictionary with the same layout as the pickles generated by
+        LoggedDataConverter."""
+        dict_datafile_data = {}
+        dict_datafile_data["UTC_start"] = self.UTC_start
+        dict_datafile_data["UTC_end"] = self.UTC_end
+        dict_datafile_data["logger_ID"] = float(self.logger_ID)
+        dict_datafile_data["number_of_logged_signals"] = self.number_of_logged_signals
+
+        def concatenate(list_arrays):
+            if len(list_arrays) == 0:
+                array_out = np.zeros((0,))
+            else:
+                array_out = np.concatenate(list_arrays).astype(np.float64)
+
+            if row_mask is not None:
+                array_out = array_out[row_mask]
+
+            return(array_out)
+
+        dict_datafile_data["measurement_numbers"] = concatenate([crrt_block[0] for crrt_block in list_decoded_blocks])
+
+        for ind_signal in range(self.number_of_logged_signals):
+            dict_datafile_data["timestamps_signal_" + str(ind_signal)] = concatenate([crrt_block[1][ind_signal] for crrt_block in list_decoded_blocks])
+            dict_datafile_data["data_signal_" + str(ind_signal)] = concatenate([crrt_block[2][ind_signal] for crrt_block in list_decoded_blocks])
+
+        return(dict_datafile_data)
+
+    def read_all(self):
+        """Decode the whole archive."""
+        with open(self.archive_path, 'rb') as handle:
+            list_decoded_blocks = [self.decode_block(handle, ind_block) for ind_block in range(len(self.list_index_entries))]
+
+        return(self.assemble_dict(list_decoded_blocks))
+
+    def read_time_window(self, time_start_uS, time_end_uS):
+        """Decode the rows for which the unwrapped Arduino timestamp of signal 0
+        (see the description of the format at the top of this file) is in
+        [time_start_uS, time_end_uS]. Before the first wrap-around of micros(),
+        this is the same as the Arduino timestamp; rows logged after the n-th
+        wrap-around are found at their Arduino timestamp + n * 2**32. Only the
+        blocks overlapping the window, according to the block index, are
+        decompressed."""
+
+        if self.number_of_logged_signals == 0:
+            raise ValueError("no timestamps in archive, cannot select a time window")
+
+        list_blocks_to_read = [ind_block for (ind_block, crrt_entry) in enumerate(self.list_index_entries)
+                               if crrt_entry[5] >= time_start_uS and crrt_entry[4] <= time_end_uS]
+
+        if self.verbose > 0:
+            print("- decoding " + str(len(list_blocks_to_read)) + " out of " + str(len(self.list_index_entries)) + " blocks")
+
+        with open(self.archive_path, 'rb') as handle:
+            list_decoded_blocks = [self.decode_block(handle, ind_block) for ind_block in list_blocks_to_read]
+
+        if len(list_decoded_blocks) == 0:
+            return(self.assemble_dict(list_decoded_blocks))
+
+        unwrapped_timestamps_signal_0 = np.concatenate([unwrap_timestamps(crrt_block[1][0], self.list_index_entries[ind_block][4])
+                                                        for (ind_block, crrt_block) in zip(list_blocks_to_read, list_decoded_blocks)])
+        row_mask = np.logical_and(unwrapped_timestamps_signal_0 >= time_start_uS, unwrapped_timestamps_signal_0 <= time_end_uS)
+
+        return(self.assemble_dict(list_decoded_blocks, row_mask))
+
+
+# use the code /////////////////////////////////////////////////////////////////
+if __name__ == "__main__":
+    instance_LoggedDataArchiver = LoggedDataArchiver(verbose=1, path_in='/home/jrlab/Desktop/Data/DataHSVA_pickled/', path_out='/home/jrlab/Desktop/Data/DataHSVA_archived/')
+    instance_LoggedDataArchiver.find_pickle_files()
+    instance_LoggedDataArchiver.archive_one_folder()
@@ -0,0 +1,267 @@
+from __future__ import division
+from __future__ import print_function
+import numpy as np
+import base64
+import shutil
+import tempfile
+import os
+import struct
+from archive_logged_data import LoggedDataArchiver, LoggedDataArchiveReader, load_pickle, FOOTER_FORMAT
+
+# Self checks for archive_logged_data.py. Run from the log_gauges folder:
+#   python check_archive_logged_data.py
+# Each check raises an AssertionError if the archive does not behave as expected.
+
+# pickle generated with Python 2.7 and numpy 1.16 by the same code as in
+# LoggedDataConverter (protocol 2), with 5 rows, 4 signals and the timestamps of
+# signals 0 and 1 wrapping around 2**32
+PYTHON_2_PICKLE = (
+    'gAJ9cQAoVRN0aW1lc3RhbXBzX3NpZ25hbF8wcQFjbnVtcHkuY29yZS5tdWx0aWFycmF5Cl9yZWNvbnN0cnVjdApxAmNudW1weQpu'
+    'ZGFycmF5CnEDSwCFcQRVAWJxBYdxBlJxByhLAUsFhXEIY251bXB5CmR0eXBlCnEJVQJmOHEKSwBLAYdxC1JxDChLA1UBPHENTk5O'
+    'Sv////9K/////0sAdHEOYolVKAAAANv//+9BAAAA9P//70EAAAAAAABaQAAAAAAAAHNAAAAAAACAf0BxD3RxEGJVE3RpbWVzdGFt'
+    'cHNfc2lnbmFsXzFxEWgCaANLAIVxEmgFh3ETUnEUKEsBSwWFcRVoDIlVKAAAgOf//+9BAABA////70EAAAAAAEBoQAAAAAAAoHhA'
+    'AAAAAACQgkBxFnRxF2JVE3RpbWVzdGFtcHNfc2lnbmFsXzJxGGgCaANLAIVxGWgFh3EaUnEbKEsBSwWFcRxoDIlVKAAAAAAAABRA'
+    'AAAAAACgaUAAAAAAAFB5QAAAAAAA6IJAAAAAAAAoiUBxHXRxHmJVE3RpbWVzdGFtcHNfc2lnbmFsXzNxH2gCaANLAIVxIGgFh3Eh'
+    'UnEiKEsBSwWFcSNoDIlVKAAAAAAAAPA/AAAAAAAogEAAAAAAAMiPQAAAAAAAtJdAAAAAAACEn0BxJHRxJWJVE21lYXN1cmVtZW50'
+    'X251bWJlcnNxJmgCaANLAIVxJ2gFh3EoUnEpKEsBSwWFcSpoDIlVKAAAAAAAgERAAAAAAAAARUAAAAAAAIBFQAAAAAAAAEZAAAAA'
+    'AACARkBxK3RxLGJVDWRhdGFfc2lnbmFsXzNxLWgCaANLAIVxLmgFh3EvUnEwKEsBSwWFcTFoDIlVKAAAAAAA4IVAAAAAAADohUAA'
+    'AAAAAPCFQAAAAAAA+IVAAAAAAAAAhkBxMnRxM2JVDWRhdGFfc2lnbmFsXzJxNGgCaANLAIVxNWgFh3E2UnE3KEsBSwWFcThoDIlV'
+    'KAAAAAAA+I9AAAAAAADwj0AAAAAAAAAAAAAAAAAAAIBAAAAAAAAIgEBxOXRxOmJVDWRhdGFfc2lnbmFsXzFxO2gCaANLAIVxPGgF'
+    'h3E9UnE+KEsBSwWFcT9oDIlVKAAAAAAAAAAAAAAAAAAA8D8AAAAAAAAAQAAAAAAAAAhAAAAAAAAAEEBxQHRxQWJVB1VUQ19lbmRx'
+    'QlUaMjAxOC0wMy0wNSAxMDowMjowMi42NTQzMjFxQ1UJbG9nZ2VyX0lEcURjbnVtcHkuY29yZS5tdWx0aWFycmF5CnNjYWxhcgpx'
+    'RWgMVQgAAAAAAAAIQHFGhnFHUnFIVQlVVENfc3RhcnRxSVUaMjAxOC0wMy0wNSAxMDowMjowMS4xMjM0NTZxSlUNZGF0YV9zaWdu'
+    'YWxfMHFLaAJoA0sAhXFMaAWHcU1ScU4oSwFLBYVxT2gMiVUoAAAAAAAAAEAAAAAAAMByQAAAAAAAwIJAAAAAAAAgjEAAAAAAAECP'
+    'QHFQdHFRYlUYbnVtYmVyX29mX2xvZ2dlZF9zaWduYWxzcVJLBHUu'
+)
+
+
+def generate_dict(nbr_rows, number_of_logged_signals, timestamp_start_uS, seed=0, period_uS=1000):
+    """Generate a dictionary with the layout of the pickles of LoggedDataConverter,
+    the Arduino timestamps starting at timestamp_start_uS and wrapping around
+    2**32."""
+    random_state = np.random.RandomState(seed)
+
+    dict_datafile_data = {}
+    dict_datafile_data["UTC_start"] = "2018-03-05 10:02:01.123456"
+    dict_datafile_data["UTC_end"] = "2018-03-05 11:02:01.654321"
+    dict_datafile_data["logger_ID"] = 3.0
+    dict_datafile_data["number_of_logged_signals"] = number_of_logged_signals
+    dict_datafile_data["measurement_numbers"] = np.arange(nbr_rows, dtype=np.float64)
+
+    # about one measurement every period_uS on each signal, with some jitter
+    timestamps = timestamp_start_uS + np.cumsum(random_state.randint(period_uS - 10, period_uS + 10, size=nbr_rows)).astype(np.int64)
+
+    for ind_signal in range(number_of_logged_signals):
+        crrt_timestamps = (timestamps + 250 * ind_signal) % 2**32
+        crrt_data = np.clip(512 + np.cumsum(random_state.randint(-3, 4, size=nbr_rows)), 0, 1023)
+
+        dict_datafile_data["timestamps_signal_" + str(ind_signal)] = crrt_timestamps.astype(np.float64)
+        dict_datafile_data["data_signal_" + str(ind_signal)] = crrt_data.astype(np.float64)
+
+    return(dict_datafile_data)
+
+
+def assert_same_dict(dict_reference, dict_read):
+    assert sorted(dict_reference.keys()) == sorted(dict_read.keys())
+
+    for crrt_key in dict_reference:
+        if isinstance(dict_reference[crrt_key], np.ndarray):
+            assert np.array_equal(dict_reference[crrt_key], dict_read[crrt_key]), crrt_key
+        else:
+            assert dict_reference[crrt_key] == dict_read[crrt_key], crrt_key
+            assert type(dict_reference[crrt_key]) == type(dict_read[crrt_key]) or crrt_key == "logger_ID", crrt_key
+
+
+def check_python_2_pickle(path_tmp):
+    path_in = os.path.join(path_tmp, "pickled")
+    path_out = os.path.join(path_tmp, "archived")
+    os.mkdir(path_in)
+    os.mkdir(path_out)
+
+    path_pickle = os.path.join(path_in, "F20180305_100201.pkl")
+    with open(path_pickle, 'wb') as handle:
+        handle.write(base64.b64decode(PYTHON_2_PICKLE))
+
+    with open(path_pickle, 'rb') as handle:
+        dict_pickle = load_pickle(handle)
+
+    for crrt_codec in ['zlib', 'lzma']:
+        try:
+            instance_LoggedDataArchiver = LoggedDataArchiver(path_in=path_in, path_out=path_out, block_size=2, codec=crrt_codec)
+        except ValueError:
+            print("- " + crrt_codec + " not available, skipped")
+            continue
+
+        instance_LoggedDataArchiver.find_pickle_files()
+        instance_LoggedDataArchiver.archive_one_folder()
+
+        dict_read = LoggedDataArchiveReader(os.path.join(path_out, "F20180305_100201.lgar")).read_all()
+        assert_same_dict(dict_pickle, dict_read)
+
+    print("- python 2 pickle: ok")
+
+
+def check_round_trip(path_tmp):
+    # row counts which are not multiple of 4 (10 bits packing) nor of block_size,
+    # and timestamps wrapping around 2**32 in the middle of the run
+    for nbr_rows in [1, 3, 4, 5, 1023, 1024, 1025, 4097]:
+        for block_size in [1, 7, 1024, 4096]:
+            dict_reference = generate_dict(nbr_rows, 4, 2**32 - 500 * nbr_rows, seed=nbr_rows)
+            path_archive = os.path.join(path_tmp, "round_trip.lgar")
+
+            LoggedDataArchiver(block_size=block_size).write_archive(dict_reference, path_archive)
+            instance_LoggedDataArchiveReader = LoggedDataArchiveReader(path_archive)
+
+            assert len(instance_LoggedDataArchiveReader.list_index_entries) == (nbr_rows + block_size - 1) // block_size
+            assert_same_dict(dict_reference, instance_LoggedDataArchiveReader.read_all())
+
+    print("- round trip: ok")
+
+
+def check_time_window(path_tmp):
+    # a short run wrapping around 2**32 once, and a 2.5 hours run at 200 Hz wrapping
+    # around twice
+    list_runs = [(generate_dict(20000, 4, 2**32 - 5000000), 1000),
+                 (generate_dict(1800000, 2, 0, period_uS=5000), 4096)]
+
+    for (dict_reference, block_size) in list_runs:
+        path_archive = os.path.join(path_tmp, "time_window.lgar")
+
+        LoggedDataArchiver(block_size=block_size).write_archive(dict_reference, path_archive)
+        instance_LoggedDataArchiveReader = LoggedDataArchiveReader(path_archive)
+
+        # no block index entry should cover more than the time of its own rows
+        for crrt_entry in instance_LoggedDataArchiveReader.list_index_entries:
+            assert crrt_entry[5] - crrt_entry[4] < 2 * block_size * 5000
+
+        # unwrapped time of signal 0, computed from the wrap-arounds of the timestamps
+        timestamps_signal_0 = dict_reference["timestamps_signal_0"].astype(np.int64)
+        unwrapped_timestamps_signal_0 = timestamps_signal_0 + 2**32 * np.concatenate(([0], np.cumsum(np.diff(timestamps_signal_0) < 0)))
+        assert unwrapped_timestamps_signal_0[-1] > 2**32
+
+        # before the wrap-around, across it, after it, long after the start of the
+        # run, outside of the run, and a single row
+        list_windows = [(unwrapped_timestamps_signal_0[0] + 1000000, unwrapped_timestamps_signal_0[0] + 2000000),
+                        (2**32 - 100000, 2**32 + 100000),
+                        (2**32 + 1000000, 2**32 + 2000000),
+                        (2 * 2**32 + 10000000, 2 * 2**32 + 11000000),
+                        (0, unwrapped_timestamps_signal_0[0] - 1),
+                        (unwrapped_timestamps_signal_0[12345], unwrapped_timestamps_signal_0[12345])]
+
+        for (time_start_uS, time_end_uS) in list_windows:
+            row_mask = np.logical_and(unwrapped_timestamps_signal_0 >= time_start_uS, unwrapped_timestamps_signal_0 <= time_end_uS)
+
+            dict_expected = dict(dict_reference)
+            for crrt_key in dict_reference:
+                if isinstance(dict_reference[crrt_key], np.ndarray):
+                    dict_expected[crrt_key] = dict_reference[crrt_key][row_mask]
+
+            assert_same_dict(dict_expected, instance_LoggedDataArchiveReader.read_time_window(time_start_uS, time_end_uS))
+
+    print("- time window: ok")
+
+
+def check_compression(path_tmp, nbr_rows=360000):
+    """Compare the size of the archive with the size of the same data written
+    with the layout of the .logdat files."""
+    dict_reference = generate_dict(nbr_rows, 4, 0)
+
+    path_csv = os.path.join(path_tmp, "compression.logdat")
+    columns = [dict_reference["timestamps_signal_" + str(ind_signal)] for ind_signal in range(4)] + \
+              [dict_reference["data_signal_" + str(ind_signal)] for ind_signal in range(4)] + \
+              [dict_reference["measurement_numbers"], dict_reference["logger_ID"] * np.ones((nbr_rows,))]
+    np.savetxt(path_csv, np.column_stack(columns), fmt='%d', delimiter=',')
+    size_csv = os.path.getsize(path_csv)
+
+    for crrt_codec in ['zlib', 'lzma']:
+        try:
+            instance_LoggedDataArchiver = LoggedDataArchiver(codec=crrt_codec)
+        except ValueError:
+            print("- " + crrt_codec + " not available, skipped")
+            continue
+
+        path_archive = os.path.join(path_tmp, "compression_" + crrt_codec + ".lgar")
+        instance_LoggedDataArchiver.write_archive(dict_reference, path_archive)
+        size_archive = os.path.getsize(path_archive)
+
+        print("- compression " + crrt_codec + ": " + str(size_csv) + " bytes as csv, " + str(size_archive) +
+              " bytes as archive, ratio " + str(round(size_csv / size_archive, 1)))
+
+        assert_same_dict(dict_reference, LoggedDataArchiveReader(path_archive).read_all())
+
+
+def check_failed_write(path_tmp):
+    for crrt_block_size in [0, 2**32]:
+        try:
+            LoggedDataArchiver(block_size=crrt_block_size)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("block_size " + str(crrt_block_size) + " was accepted")
+
+    # a logger_ID which does not fit in the header makes the writing fail once the
+    # archive file is opened
+    dict_datafile_data = generate_dict(10, 2, 0)
+    dict_datafile_data["logger_ID"] = 2.0**32
+    path_archive = os.path.join(path_tmp, "failed.lgar")
+
+    try:
+        LoggedDataArchiver().write_archive(dict_datafile_data, path_archive)
+    except Exception:
+        pass
+    else:
+        raise AssertionError("invalid logger_ID was accepted")
+
+    assert not os.path.exists(path_archive)
+
+    print("- failed write: ok")
+
+
+def assert_invalid_archive(path_archive, archive_content):
+    with open(path_archive, 'wb') as handle:
+        handle.write(archive_content)
+
+    try:
+        LoggedDataArchiveReader(path_archive)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("invalid archive was accepted")
+
+
+def check_invalid_archive(path_tmp):
+    path_archive = os.path.join(path_tmp, "invalid.lgar")
+    LoggedDataArchiver(block_size=3).write_archive(generate_dict(10, 2, 0), path_archive)
+
+    with open(path_archive, 'rb') as handle:
+        archive_content = handle.read()
+
+    footer_size = struct.calcsize(FOOTER_FORMAT)
+    (index_offset, nbr_blocks, index_magic) = struct.unpack(FOOTER_FORMAT, archive_content[-footer_size:])
+
+    # truncated at any position
+    for crrt_size in range(len(archive_content)):
+        assert_invalid_archive(path_archive, archive_content[:crrt_size])
+
+    # footer pointing to a wrong index
+    for (crrt_index_offset, crrt_nbr_blocks) in [(index_offset + 1, nbr_blocks), (index_offset - 1, nbr_blocks),
+                                                 (index_offset, nbr_blocks + 1), (index_offset, nbr_blocks - 1),
+                                                 (2**63, nbr_blocks), (index_offset, 2**32 - 1)]:
+        assert_invalid_archive(path_archive, archive_content[:-footer_size] + struct.pack(FOOTER_FORMAT, crrt_index_offset, crrt_nbr_blocks, index_magic))
+
+    print("- invalid archive: ok")
+
+
+# use the code /////////////////////////////////////////////////////////////////
+if __name__ == "__main__":
+    path_tmp = tempfile.mkdtemp()
+
+    try:
+        check_python_2_pickle(path_tmp)
+        check_round_trip(path_tmp)
+        check_time_window(path_tmp)
+        check_failed_write(path_tmp)
+        check_invalid_archive(path_tmp)
+        check_compression(path_tmp)
+    finally:
+        shutil.rmtree(path_tmp)